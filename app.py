@@ -3,10 +3,11 @@ import logging
 import tempfile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, make_url
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (set LOG_LEVEL=DEBUG for verbose output)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 # Set up database base class
 class Base(DeclarativeBase):
@@ -31,10 +32,47 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# SQLite tuning applied to every new connection: WAL lets readers run
+# alongside a writer, and NORMAL sync is safe with WAL
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+database_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+is_sqlite = database_url.get_backend_name() == "sqlite"
+# Flask-SQLAlchemy gives in-memory SQLite a StaticPool, which takes no sizing options
+is_memory_sqlite = is_sqlite and database_url.database in (None, "", ":memory:")
+
+if not is_memory_sqlite:
+    # Keep one connection open per worker thread (gunicorn runs 8, see Procfile),
+    # so 4 workers hold at most 32 connections
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "8")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "0")),
+    )
+
+if is_sqlite:
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {
+        "check_same_thread": False,
+        "timeout": 30,
+    }
+
 # Initialize the app with the extension
 db.init_app(app)
 
 with app.app_context():
+    if is_sqlite:
+        @event.listens_for(db.engine, "connect")
+        def _set_sqlite_pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+    
     # Import models
     import models  # noqa: F401
     
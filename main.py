@@ -18,4 +18,6 @@ def format_currency(value):
     return f"{value:,.2f}"
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server only; debug mode follows FLASK_DEBUG. Production runs
+    # under gunicorn (see Procfile)
+    app.run(host="0.0.0.0", port=5000)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import func
 from app import db
 import base64
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -11,8 +12,8 @@ class Company(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
     # Relationships
-    transactions = db.relationship('Transaction', backref='company', lazy=True, cascade="all, delete-orphan")
-    file = db.relationship('CompanyFile', backref='company', uselist=False, cascade="all, delete-orphan")
+    transactions = db.relationship('Transaction', back_populates='company', lazy=True, cascade="all, delete-orphan")
+    file = db.relationship('CompanyFile', back_populates='company', uselist=False, cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Company {self.name}>"
@@ -21,12 +22,16 @@ class CompanyFile(db.Model):
     """Model for storing company Excel files"""
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    file_data = db.Column(db.LargeBinary, nullable=False)  # Store the actual file data
+    # Store the actual file data; deferred so it is only loaded when the file is downloaded
+    file_data = db.deferred(db.Column(db.LargeBinary, nullable=False))
     content_type = db.Column(db.String(100), nullable=False, default='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False, unique=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.now)
     file_password_hash = db.Column(db.String(256), nullable=True)  # Store password hash for file access
     
+    # Relationships
+    company = db.relationship('Company', back_populates='file')
+    
     def __repr__(self):
         return f"<CompanyFile {self.filename} for company {self.company_id}>"
         
@@ -56,6 +61,21 @@ class Transaction(db.Model):
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     
+    # Relationships
+    company = db.relationship('Company', back_populates='transactions')
+    
+    # Indexes matching the report queries, all scoped to a company
+    __table_args__ = (
+        # Trial balance and special report totals, grouped by head of account
+        db.Index('ix_txn_co_head', 'company_id', 'head_of_account'),
+        # Heads of account used in a category (also serves category lookups)
+        db.Index('ix_txn_co_cat_head', 'company_id', 'category', 'head_of_account'),
+        # Trial balance periods and period filters
+        db.Index('ix_txn_co_date', 'company_id', 'date', 'id'),
+        # Case-insensitive ledger lookups, in ledger order
+        db.Index('ix_txn_head_upper', company_id, func.upper(head_of_account), date, id),
+    )
+    
     def __repr__(self):
         return f"<Transaction {self.id}: {self.head_of_account} - {self.debit}/{self.credit}>"
         
@@ -1,35 +1,92 @@
 import os
 import io
+import hmac
 import pandas as pd
 from datetime import datetime
 from functools import wraps
 from flask import render_template, request, redirect, url_for, flash, session, send_file, abort
 from werkzeug.utils import secure_filename
-from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import func
+from sqlalchemy import func, extract, select, bindparam
+from sqlalchemy.orm import selectinload
 from app import app, db
 from models import Company, Transaction, CompanyFile
 from utils import process_excel_file, get_ledger_data, get_special_report_data, get_trial_balance_data, process_excel_data
 
-# Add context processor to make functions available to templates
-@app.context_processor
-def utility_processor():
+# Report lookups built once at import and run with bound parameters
+
+# Distinct head of accounts with case-insensitive comparison; grouping on
+# func.upper lists each account once, whatever its capitalization
+LEDGER_ACCOUNTS_STMT = select(func.min(Transaction.head_of_account))\
+    .where(Transaction.company_id == bindparam('company_id'), Transaction.head_of_account != '')\
+    .group_by(func.upper(Transaction.head_of_account))\
+    .order_by(func.upper(Transaction.head_of_account))
+
+CATEGORIES_STMT = select(Transaction.category)\
+    .where(Transaction.company_id == bindparam('company_id'), Transaction.category != '')\
+    .distinct()\
+    .order_by(Transaction.category)
+
+# Periods (month and year combinations) in chronological order
+_year = extract('year', Transaction.date)
+_month = extract('month', Transaction.date)
+PERIODS_STMT = select(_year, _month)\
+    .where(Transaction.company_id == bindparam('company_id'))\
+    .distinct()\
+    .order_by(_year, _month)
+
+# Fixed system password required for uploads and downloads
+SYSTEM_PASSWORD = b"Faiz5683"
+
+def check_system_password(password):
+    """Compare a submitted password to the system password in constant time"""
+    return hmac.compare_digest(password.encode(), SYSTEM_PASSWORD)
+
+# Company list shown on the home page, cached per process together with the
+# version of the companies table it was built from
+_companies_cache = {'entry': None}
+
+# Every upload adds a company or bumps its updated_at, so this cheap aggregate
+# changes whenever the list or a company's file changes, in any worker
+COMPANIES_VERSION_STMT = select(func.count(Company.id), func.max(Company.updated_at))
+
+def _company_summary(company):
+    """Plain copy of the company fields the home page shows, safe to share between requests"""
+    file = company.file
     return {
-        'now': datetime.now
+        'id': company.id,
+        'name': company.name,
+        'created_at': company.created_at,
+        'updated_at': company.updated_at,
+        'file': {
+            'filename': file.filename,
+            'content_type': file.content_type,
+            'uploaded_at': file.uploaded_at
+        } if file else None
     }
 
-# Add Jinja filter for currency formatting
-@app.template_filter('format_currency')
-def format_currency(value):
-    """Format a number as PKR currency"""
-    if value is None:
-        return "PKR 0.00"
-    return f"{value:,.2f}"
+def get_companies():
+    """
+    Return all companies ordered by name, reloading them only when the table changed
+    Companies are returned as dicts rather than ORM objects, since the cache
+    outlives the session that loaded them and is shared by every thread
+    """
+    version = tuple(db.session.execute(COMPANIES_VERSION_STMT).one())
+    
+    # Read the entry once so a concurrent refresh can't change it under us
+    entry = _companies_cache['entry']
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    
+    # Load every company's file in one extra query instead of one per company
+    companies = Company.query.options(selectinload(Company.file)).order_by(Company.name).all()
+    companies = [_company_summary(company) for company in companies]
+    _companies_cache['entry'] = (version, companies)
+    return companies
 
 @app.route("/")
 def index():
     """Home page route"""
-    companies = Company.query.order_by(Company.name).all()
+    companies = get_companies()
     selected_company_id = session.get('selected_company_id')
     
     return render_template(
@@ -61,7 +118,7 @@ def upload_file():
         file_password = request.form.get('file_password', '').strip()
         
         # Check if the password is correct (fixed system password)
-        if file_password != "Faiz5683":
+        if not check_system_password(file_password):
             flash('Incorrect password. Please try again.', 'error')
             return redirect(url_for('index'))
         
@@ -69,8 +126,7 @@ def upload_file():
         company = Company.query.filter_by(name=company_name).first()
         
         if company:
-            # Delete existing transactions for this company
-            Transaction.query.filter_by(company_id=company.id).delete()
+            # Existing transactions are replaced by process_excel_data
             company.updated_at = datetime.now()
         else:
             # Create new company
@@ -79,29 +135,29 @@ def upload_file():
             # Commit to get a valid ID before creating transactions
             db.session.commit()
         
-        # Get file data
-        file_data = file.read()
         filename = secure_filename(file.filename)
         
         try:
+            # Process Excel file straight from the upload stream, which Werkzeug
+            # spools to disk for large files, instead of copying it into memory
+            file.stream.seek(0)
+            transaction_count = process_excel_data(file.stream, company)
+            
             # Delete existing file for this company if it exists
             if company.file:
                 db.session.delete(company.file)
                 db.session.flush()
             
-            # Store the file in the database
+            # Store the file in the database, reading the upload only once for it
+            file.stream.seek(0)
             company_file = CompanyFile(
                 filename=filename,
-                file_data=file_data,
+                file_data=file.stream.read(),
                 content_type=file.content_type or 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 company_id=company.id
             )
             
             db.session.add(company_file)
-            db.session.flush()
-            
-            # Process Excel file
-            transaction_count = process_excel_data(file_data, company)
             db.session.commit()
             
             # Store selected company in session
@@ -134,16 +190,7 @@ def ledger():
     company = Company.query.get_or_404(company_id)
     
     # Get distinct head of accounts with case-insensitive comparison
-    # Use func.upper to normalize the head_of_account for consistent comparison
-    head_of_accounts = db.session.query(func.upper(Transaction.head_of_account).label('normalized_head'), 
-                                        Transaction.head_of_account)\
-        .filter(Transaction.company_id == company_id, Transaction.head_of_account != '')\
-        .distinct(func.upper(Transaction.head_of_account))\
-        .order_by(func.upper(Transaction.head_of_account))\
-        .all()
-    
-    # Extract the actual head_of_account values (index 1 in each tuple)
-    unique_accounts = [account[1] for account in head_of_accounts]
+    unique_accounts = db.session.execute(LEDGER_ACCOUNTS_STMT, {'company_id': company_id}).scalars().all()
     
     # Get data for selected account or first account
     selected_account = request.args.get('account', unique_accounts[0] if unique_accounts else None)
@@ -167,21 +214,17 @@ def special_report():
         return redirect(url_for('index'))
     
     company = Company.query.get_or_404(company_id)
-    categories = db.session.query(Transaction.category)\
-        .filter(Transaction.company_id == company_id, Transaction.category != '')\
-        .distinct()\
-        .order_by(Transaction.category)\
-        .all()
+    categories = db.session.execute(CATEGORIES_STMT, {'company_id': company_id}).scalars().all()
     
     # Get data for selected category or first category
-    selected_category = request.args.get('category', categories[0][0] if categories else None)
+    selected_category = request.args.get('category', categories[0] if categories else None)
     
     report_data = get_special_report_data(company_id, selected_category) if selected_category else []
     
     return render_template(
         "special_report.html",
         company=company,
-        categories=[category[0] for category in categories],
+        categories=categories,
         selected_category=selected_category,
         report_data=report_data
     )
@@ -196,14 +239,9 @@ def trial_balance():
     
     company = Company.query.get_or_404(company_id)
     
-    # Get periods (month and year combinations)
-    transactions = Transaction.query.filter_by(company_id=company_id).order_by(Transaction.date).all()
-    periods = set()
-    for t in transactions:
-        periods.add(t.date.strftime("%m/%Y"))
-    
-    # Sort periods
-    periods = sorted(periods, key=lambda x: datetime.strptime(x, "%m/%Y"))
+    # Get periods (month and year combinations) in chronological order
+    period_rows = db.session.execute(PERIODS_STMT, {'company_id': company_id})
+    periods = [f"{int(m):02d}/{int(y)}" for y, m in period_rows]
     
     # Selected period (default to all)
     selected_period = request.args.get('period', 'all')
@@ -240,7 +278,7 @@ def download_file(company_id):
     if request.method == "POST":
         # Verify password against fixed system password
         password = request.form.get('file_password', '')
-        if password != "Faiz5683":
+        if not check_system_password(password):
             flash('Incorrect password', 'error')
             return render_template(
                 "password_prompt.html",
@@ -1,11 +1,55 @@
 import pandas as pd
 import numpy as np
-import io
-from datetime import datetime
-from sqlalchemy import func, extract
+import openpyxl
+from datetime import date, datetime
+from sqlalchemy import func, extract, select, insert, delete, bindparam, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 from app import db
 from models import Transaction, CompanyFile
 
+# Excel column headers mapped to model attributes
+COLUMN_MAPPING = {
+    'Date': 'date',
+    'Head of Accounts': 'head_of_account',
+    'Category': 'category',
+    'Description': 'description',
+    'Ref': 'reference',
+    'Debit': 'debit',
+    'Credit': 'credit'
+}
+REQUIRED_COLUMNS = ['Date', 'Head of Accounts', 'Debit', 'Credit']
+
+# Number of rows buffered before each bulk insert
+INGEST_BATCH_SIZE = 1000
+
+TRANSACTION_COLUMNS = ['date', 'head_of_account', 'category', 'description',
+                       'reference', 'debit', 'credit', 'company_id']
+
+def _insert_transactions(df, company):
+    """
+    Normalize a cleaned transactions DataFrame and bulk insert it in batches
+    Returns the number of rows inserted
+    """
+    heads = df['head_of_account'].astype('string').str.strip()
+    df = df[heads != ''].copy()
+    heads = heads[heads != '']
+    
+    # Use the first occurrence of each head of account (case insensitive);
+    # sort=False skips sorting the group keys, which transform doesn't need
+    df['head_of_account'] = heads.groupby(heads.str.upper(), sort=False).transform('first')
+    df['date'] = df['date'].dt.date
+    df[['debit', 'credit']] = df[['debit', 'credit']].fillna(0.0).astype(float)
+    df['company_id'] = company.id
+    
+    # Convert and insert in batches so only one batch of dicts exists at a time
+    rows = df[TRANSACTION_COLUMNS]
+    for start in range(0, len(rows), INGEST_BATCH_SIZE):
+        records = rows.iloc[start:start + INGEST_BATCH_SIZE].to_dict('records')
+        db.session.execute(insert(Transaction), records)
+    
+    return len(rows)
+
 def process_excel_file(filepath, company):
     """
     Process Excel file and add transactions to database
@@ -16,24 +60,13 @@ def process_excel_file(filepath, company):
         df = pd.read_excel(filepath)
         
         # Check required columns
-        required_columns = ['Date', 'Head of Accounts', 'Debit', 'Credit']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
         
         if missing_columns:
             raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
         
         # Rename columns to match model attributes
-        column_mapping = {
-            'Date': 'date',
-            'Head of Accounts': 'head_of_account',
-            'Category': 'category',
-            'Description': 'description',
-            'Ref': 'reference',
-            'Debit': 'debit',
-            'Credit': 'credit'
-        }
-        
-        df = df.rename(columns=column_mapping)
+        df = df.rename(columns=COLUMN_MAPPING)
         
         # Fill NaN values
         df['category'] = df.get('category', pd.Series()).fillna('')
@@ -48,124 +81,138 @@ def process_excel_file(filepath, company):
         # Filter out invalid records
         df = df.dropna(subset=['date', 'head_of_account'])
         
-        # First pass: collect all unique head of accounts (case insensitive)
-        head_of_accounts_map = {}
-        for _, row in df.iterrows():
-            if not pd.isna(row['head_of_account']) and row['head_of_account'] != '':
-                head = str(row['head_of_account']).strip()
-                head_upper = head.upper()
-                
-                # Store the first occurrence of each head of account
-                if head_upper not in head_of_accounts_map:
-                    head_of_accounts_map[head_upper] = head
-        
-        # Add transactions to database
-        transaction_count = 0
-        for _, row in df.iterrows():
-            if not pd.isna(row['head_of_account']) and row['head_of_account'] != '':
-                # Use consistent capitalization for each head of account
-                head = str(row['head_of_account']).strip()
-                normalized_head = head_of_accounts_map[head.upper()]
-                
-                transaction = Transaction(
-                    date=row['date'].date(),
-                    head_of_account=normalized_head,  # Use normalized version
-                    category=row.get('category', ''),
-                    description=row.get('description', ''),
-                    reference=row.get('reference', ''),
-                    debit=float(row.get('debit', 0) or 0),
-                    credit=float(row.get('credit', 0) or 0),
-                    company_id=company.id
-                )
-                db.session.add(transaction)
-                transaction_count += 1
-        
-        return transaction_count
+        return _insert_transactions(df, company)
     
     except Exception as e:
         # Re-raise the exception to be caught and handled by the caller
         raise Exception(f"Failed to process Excel file: {str(e)}")
         
-def process_excel_data(file_data, company):
+def process_excel_data(excel_file, company):
     """
-    Process Excel file data from memory
+    Process an uploaded Excel file object, replacing the company's existing transactions
+    Streams the worksheet row by row and inserts transactions in batches
     Returns the number of rows processed
     """
+    wb = None
     try:
-        # Read Excel file from binary data
-        excel_data = io.BytesIO(file_data)
-        df = pd.read_excel(excel_data)
+        # Delete existing transactions for this company without loading them
+        db.session.execute(delete(Transaction).where(Transaction.company_id == company.id))
+        
+        # Open the workbook in read-only mode so cells are parsed lazily
+        wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+        # Read the first worksheet, like pd.read_excel, whichever sheet was last selected
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        
+        # Map model attributes to column positions
+        columns = {}
+        for index, name in enumerate(header):
+            if isinstance(name, str) and name.strip() in COLUMN_MAPPING:
+                columns.setdefault(COLUMN_MAPPING[name.strip()], index)
         
         # Check required columns
-        required_columns = ['Date', 'Head of Accounts', 'Debit', 'Credit']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if COLUMN_MAPPING[col] not in columns]
         
         if missing_columns:
             raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
         
-        # Rename columns to match model attributes
-        column_mapping = {
-            'Date': 'date',
-            'Head of Accounts': 'head_of_account',
-            'Category': 'category',
-            'Description': 'description',
-            'Ref': 'reference',
-            'Debit': 'debit',
-            'Credit': 'credit'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        # Fill NaN values
-        df['category'] = df.get('category', pd.Series()).fillna('')
-        df['description'] = df.get('description', pd.Series()).fillna('')
-        df['reference'] = df.get('reference', pd.Series()).fillna('')
-        df['debit'] = df.get('debit', pd.Series()).fillna(0.0)
-        df['credit'] = df.get('credit', pd.Series()).fillna(0.0)
-        
-        # Convert date to datetime
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        
-        # Filter out invalid records
-        df = df.dropna(subset=['date', 'head_of_account'])
+        def cell(row, field):
+            index = columns.get(field)
+            return row[index] if index is not None and index < len(row) else None
         
-        # First pass: collect all unique head of accounts (case insensitive)
         head_of_accounts_map = {}
-        for _, row in df.iterrows():
-            if not pd.isna(row['head_of_account']) and row['head_of_account'] != '':
-                head = str(row['head_of_account']).strip()
-                head_upper = head.upper()
-                
-                # Store the first occurrence of each head of account
-                if head_upper not in head_of_accounts_map:
-                    head_of_accounts_map[head_upper] = head
-        
-        # Add transactions to database
+        batch = []
         transaction_count = 0
-        for _, row in df.iterrows():
-            if not pd.isna(row['head_of_account']) and row['head_of_account'] != '':
-                # Use consistent capitalization for each head of account
-                head = str(row['head_of_account']).strip()
-                normalized_head = head_of_accounts_map[head.upper()]
+        with db.session.no_autoflush:
+            for row in rows:
+                txn_date = _coerce_date(cell(row, 'date'))
+                head_value = cell(row, 'head_of_account')
+                if txn_date is None or head_value is None:
+                    continue
+                
+                head = str(head_value).strip()
+                if not head:
+                    continue
                 
-                transaction = Transaction(
-                    date=row['date'].date(),
-                    head_of_account=normalized_head,  # Use normalized version
-                    category=row.get('category', ''),
-                    description=row.get('description', ''),
-                    reference=row.get('reference', ''),
-                    debit=float(row.get('debit', 0) or 0),
-                    credit=float(row.get('credit', 0) or 0),
-                    company_id=company.id
-                )
-                db.session.add(transaction)
-                transaction_count += 1
+                # Use the first occurrence of each head of account (case insensitive)
+                normalized_head = head_of_accounts_map.setdefault(head.upper(), head)
+                
+                batch.append({
+                    'date': txn_date,
+                    'head_of_account': normalized_head,
+                    'category': _none_to_empty(cell(row, 'category')),
+                    'description': _none_to_empty(cell(row, 'description')),
+                    'reference': _none_to_empty(cell(row, 'reference')),
+                    'debit': float(cell(row, 'debit') or 0),
+                    'credit': float(cell(row, 'credit') or 0),
+                    'company_id': company.id
+                })
+                
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    db.session.execute(insert(Transaction), batch)
+                    transaction_count += len(batch)
+                    batch.clear()
+            
+            if batch:
+                db.session.execute(insert(Transaction), batch)
+                transaction_count += len(batch)
         
         return transaction_count
     
     except Exception as e:
         # Re-raise the exception to be caught and handled by the caller
         raise Exception(f"Failed to process Excel data: {str(e)}")
+    finally:
+        if wb is not None:
+            wb.close()
+
+def _coerce_date(value):
+    """Convert a worksheet cell value to a date, or None if it is not one"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    parsed = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(parsed) else parsed.date()
+
+def _none_to_empty(value):
+    """Return an empty string for missing cell values"""
+    return '' if value is None else value
+
+class format_date(FunctionElement):
+    """SQL expression formatting a date column as DD/MM/YYYY"""
+    type = String()
+    name = 'format_date'
+    inherit_cache = True
+
+@compiles(format_date)
+def _format_date_default(element, compiler, **kw):
+    return "to_char(%s, 'DD/MM/YYYY')" % compiler.process(element.clauses, **kw)
+
+@compiles(format_date, 'sqlite')
+def _format_date_sqlite(element, compiler, **kw):
+    return "strftime('%%d/%%m/%%Y', %s)" % compiler.process(element.clauses, **kw)
+
+# Report statements are built once at import and reused with bound parameters
+# so SQLAlchemy's compiled statement cache is hit on every request
+
+# Transactions for one head of account (matching by normalized name)
+# with the running balance computed by the database
+_ledger_order = (Transaction.date, Transaction.id)
+LEDGER_STMT = select(
+    Transaction.date,
+    format_date(Transaction.date).label('formatted_date'),
+    Transaction.description,
+    Transaction.reference,
+    Transaction.debit,
+    Transaction.credit,
+    func.sum(Transaction.debit - Transaction.credit).over(order_by=_ledger_order).label('balance')
+).where(
+    Transaction.company_id == bindparam('company_id'),
+    func.upper(Transaction.head_of_account) == bindparam('head')
+).order_by(*_ledger_order)
 
 def get_ledger_data(company_id, head_of_account):
     """
@@ -175,67 +222,51 @@ def get_ledger_data(company_id, head_of_account):
     # Normalize the head of account name to prevent duplicates (case insensitive comparison)
     normalized_head = head_of_account.strip().upper()
     
-    # Get all transactions for this head of account (matching by normalized name)
-    transactions = Transaction.query\
-        .filter(
-            Transaction.company_id == company_id,
-            func.upper(Transaction.head_of_account) == normalized_head
-        )\
-        .order_by(Transaction.date, Transaction.id)\
-        .all()
-    
     ledger_data = []
-    balance = 0
     today = datetime.now().date()
     
-    for t in transactions:
-        balance += t.debit - t.credit
-        
-        # Calculate days from transaction date to today
-        days_diff = (today - t.date).days
-        
+    params = {'company_id': company_id, 'head': normalized_head}
+    for t in db.session.execute(LEDGER_STMT, params).mappings():
         ledger_data.append({
-            'date': t.formatted_date,
-            'description': t.description,
-            'reference': t.reference,
-            'debit': t.debit,
-            'credit': t.credit,
-            'balance': balance,
-            'days': days_diff
+            'date': t['formatted_date'],
+            'description': t['description'],
+            'reference': t['reference'],
+            'debit': t['debit'],
+            'credit': t['credit'],
+            'balance': t['balance'],
+            # Days from transaction date to today
+            'days': (today - t['date']).days
         })
     
     return ledger_data
 
+# Total debit and credit of each head used in a category, across all of
+# its transactions, computed for every head in a single grouped query
+_category_heads = select(Transaction.head_of_account)\
+    .where(Transaction.company_id == bindparam('company_id'), 
+           Transaction.category == bindparam('category'),
+           Transaction.head_of_account != '')
+SPECIAL_REPORT_STMT = select(
+    Transaction.head_of_account,
+    func.sum(Transaction.debit).label('total_debit'),
+    func.sum(Transaction.credit).label('total_credit')
+).where(
+    Transaction.company_id == bindparam('company_id'),
+    Transaction.head_of_account.in_(_category_heads)
+).group_by(Transaction.head_of_account)\
+    .order_by(Transaction.head_of_account)
+
 def get_special_report_data(company_id, category):
     """
     Get special report data for a specific category
     Returns a list of head of accounts with their balances
     """
-    # Get distinct head of accounts for this category
-    heads = db.session.query(Transaction.head_of_account)\
-        .filter(Transaction.company_id == company_id, 
-                Transaction.category == category,
-                Transaction.head_of_account != '')\
-        .distinct()\
-        .order_by(Transaction.head_of_account)\
-        .all()
-    
     report_data = []
     
-    for head in heads:
-        head_of_account = head[0]
-        
-        # Calculate total debit, credit and balance
-        result = db.session.query(
-            func.sum(Transaction.debit).label('total_debit'),
-            func.sum(Transaction.credit).label('total_credit')
-        ).filter(
-            Transaction.company_id == company_id,
-            Transaction.head_of_account == head_of_account
-        ).first()
-        
-        total_debit = float(result.total_debit or 0)
-        total_credit = float(result.total_credit or 0)
+    params = {'company_id': company_id, 'category': category}
+    for head_of_account, total_debit, total_credit in db.session.execute(SPECIAL_REPORT_STMT, params):
+        total_debit = float(total_debit or 0)
+        total_credit = float(total_credit or 0)
         balance = total_debit - total_credit
         
         # Skip if balance is zero
@@ -249,40 +280,43 @@ def get_special_report_data(company_id, category):
     
     return report_data
 
+# Total debit and credit of each head of account, for all periods
+TRIAL_BALANCE_STMT = select(
+    Transaction.head_of_account,
+    func.sum(Transaction.debit).label('total_debit'),
+    func.sum(Transaction.credit).label('total_credit')
+).where(
+    Transaction.company_id == bindparam('company_id'),
+    Transaction.head_of_account != ''
+).group_by(Transaction.head_of_account)\
+    .order_by(Transaction.head_of_account)
+
+# The same totals restricted to one month
+TRIAL_BALANCE_PERIOD_STMT = TRIAL_BALANCE_STMT.where(
+    extract('month', Transaction.date) == bindparam('month'),
+    extract('year', Transaction.date) == bindparam('year')
+)
+
 def get_trial_balance_data(company_id, period='all'):
     """
     Get trial balance data
     Returns a list of head of accounts with their balances
     """
-    # Build query base
-    query = db.session.query(
-        Transaction.head_of_account,
-        func.sum(Transaction.debit).label('total_debit'),
-        func.sum(Transaction.credit).label('total_credit')
-    ).filter(
-        Transaction.company_id == company_id,
-        Transaction.head_of_account != ''
-    )
-    
     # Add period filter if needed
     if period != 'all':
         month, year = period.split('/')
-        query = query.filter(
-            extract('month', Transaction.date) == int(month),
-            extract('year', Transaction.date) == int(year)
-        )
-    
-    # Group and sort
-    results = query.group_by(Transaction.head_of_account)\
-        .order_by(Transaction.head_of_account)\
-        .all()
+        stmt = TRIAL_BALANCE_PERIOD_STMT
+        params = {'company_id': company_id, 'month': int(month), 'year': int(year)}
+    else:
+        stmt = TRIAL_BALANCE_STMT
+        params = {'company_id': company_id}
     
     trial_balance_data = []
     total_debit = 0
     total_credit = 0
     
     # Process results
-    for result in results:
+    for result in db.session.execute(stmt, params):
         head_of_account = result[0]
         account_debit = float(result[1] or 0)
         account_credit = float(result[2] or 0)